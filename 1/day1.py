@@ -1,49 +1,172 @@
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import fileinput
+from functools import cache
+import mmap
+
+
+digits_to_digits = {str(i): str(i) for i in range(10)}
+
+
+words_to_digits = {
+    "one": "1",
+    "two": "2",
+    "three": "3",
+    "four": "4",
+    "five": "5",
+    "six": "6",
+    "seven": "7",
+    "eight": "8",
+    "nine": "9",
+}
+
+
+def build_automaton(words):
+    """Aho-Corasick automaton for words -> (transitions, outputs)
+
+    transitions[state] maps char -> next state with failure links already
+    followed, so scanning is one dict lookup per character. Chars that are not in
+    any word go back to the root state 0. outputs[state] is the digit for the
+    word ending at that state, or None.
+    """
+    transitions = [{}]
+    outputs = [None]
+    for word, digit in words.items():
+        state = 0
+        for char in word:
+            if char not in transitions[state]:
+                transitions[state][char] = len(transitions)
+                transitions.append({})
+                outputs.append(None)
+            state = transitions[state][char]
+        outputs[state] = digit
+
+    alphabet = {char for word in words for char in word}
+    failures = [0] * len(transitions)
+    queue = deque(transitions[0].values())
+    while queue:
+        state = queue.popleft()
+        failure = failures[state]
+        if outputs[state] is None:
+            outputs[state] = outputs[failure]
+        for char, child in transitions[state].items():
+            # Failure state is shallower, so its transitions are already complete
+            failures[child] = transitions[failure].get(char, 0)
+            queue.append(child)
+        for char in alphabet:
+            if char not in transitions[state]:
+                transitions[state][char] = transitions[failure].get(char, 0)
+    return transitions, outputs
+
+
+@cache
+def digit_automata(handle_words, binary=False):
+    """Returns (forward, backward) automata for finding the first and last digit
+
+    If binary is True, the automata scan bytes instead of str.
+    """
+    words = dict(digits_to_digits)
+    if handle_words:
+        words.update(words_to_digits)
+    if binary:
+        words = {word.encode(): digit for word, digit in words.items()}
+    forward = build_automaton(words)
+    backward = build_automaton({word[::-1]: digit for word, digit in words.items()})
+    return forward, backward
+
+
+def scan(chars, automaton):
+    """Return the digit for the first word matched in chars, or None"""
+    transitions, outputs = automaton
+    state = 0
+    for char in chars:
+        state = transitions[state].get(char, 0)
+        if outputs[state] is not None:
+            return outputs[state]
+    return None
+
+
+def calibration_number(line, forward, backward):
+    # reversed() walks the line from the end without copying it
+    first = scan(line, forward)
+    last = scan(reversed(line), backward)
+    return int(f"{first}{last}")
 
 
 def sum_calibration_numbers(lines, handle_words):
-    total = 0
-    words_to_digits = {
-        "one": "1",
-        "two": "2",
-        "three": "3",
-        "four": "4",
-        "five": "5",
-        "six": "6",
-        "seven": "7",
-        "eight": "8",
-        "nine": "9",
-    }
-    reversed_words = {"".join(reversed(word)): word for word in words_to_digits}
+    forward, backward = digit_automata(handle_words)
+    return sum(calibration_number(line, forward, backward) for line in lines)
+
+
+def sum_all_calibration_numbers(lines):
+    """Returns (total without words, total with words) in one pass over lines"""
+    without_words = digit_automata(False)
+    with_words = digit_automata(True)
+    total_without_words = 0
+    total_with_words = 0
     for line in lines:
-        first = None
-        last = None
-        line = line.strip()
-        for i, c in enumerate(line):
-            if c.isdigit():
-                first = c
-            elif handle_words:
-                for word, digit in words_to_digits.items():
-                    if line[i : i + len(word)] == word:
-                        first = digit
-            if first is not None:
-                break
-
-        reversed_line = "".join(reversed(line))
-        for i, c in enumerate(reversed_line):
-            if c.isdigit():
-                last = c
-            elif handle_words:
-                for reversed_word, word in reversed_words.items():
-                    if reversed_line[i : i + len(reversed_word)] == reversed_word:
-                        last = words_to_digits[word]
-            if last is not None:
-                break
-
-        val = int(f"{first}{last}")
-        total += val
-    return total
+        total_without_words += calibration_number(line, *without_words)
+        total_with_words += calibration_number(line, *with_words)
+    return total_without_words, total_with_words
+
+
+def chunk_bounds(data, num_chunks):
+    """Split data into about num_chunks (start, end) ranges that end after newlines"""
+    size = len(data)
+    chunk_size = max(1, size // num_chunks)
+    bounds = []
+    start = 0
+    while start < size:
+        end = data.find(b"\n", min(start + chunk_size, size) - 1)
+        end = size if end == -1 else end + 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def sum_calibration_chunk(path, start, end):
+    """Returns (total without words, total with words) for lines in [start, end)"""
+    without_words = digit_automata(False, binary=True)
+    with_words = digit_automata(True, binary=True)
+    total_without_words = 0
+    total_with_words = 0
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = start
+        while pos < end:
+            line_end = mm.find(b"\n", pos, end)
+            if line_end == -1:
+                line_end = end
+            line = mm[pos:line_end]
+            total_without_words += calibration_number(line, *without_words)
+            total_with_words += calibration_number(line, *with_words)
+            pos = line_end + 1
+    return total_without_words, total_with_words
+
+
+def sum_all_calibration_numbers_mmap(paths, processes):
+    """Like sum_all_calibration_numbers, but memory-maps paths and splits them
+    into newline-aligned chunks that are scanned in a process pool"""
+    jobs = []
+    for path in paths:
+        with open(path, "rb") as f:
+            if not f.seek(0, 2):
+                # Can't mmap an empty file
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # Several chunks per process so uneven chunks still balance out
+                jobs.extend(
+                    (path, start, end) for start, end in chunk_bounds(mm, processes * 4)
+                )
+    total_without_words = 0
+    total_with_words = 0
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for chunk_without_words, chunk_with_words in executor.map(
+            sum_calibration_chunk, *zip(*jobs)
+        ):
+            total_without_words += chunk_without_words
+            total_with_words += chunk_with_words
+    return total_without_words, total_with_words
 
 
 def main():
@@ -56,10 +179,40 @@ def main():
         nargs="*",
         help="Files to read. If empty, stdin is used.",
     )
+    parser.add_argument(
+        "--processes",
+        "-p",
+        type=int,
+        help="Memory-map FILEs and scan them with this many worker processes.",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Also compute totals with the single-process str implementation and "
+        "check they match.",
+    )
     args = parser.parse_args()
-    lines = list(fileinput.input(args.files))
-    print(f"Total without words: {sum_calibration_numbers(lines, False)}")
-    print(f"Total with words: {sum_calibration_numbers(lines, True)}")
+    if args.check and not args.files:
+        parser.error("--check requires FILEs, stdin can only be read once")
+    if args.processes:
+        if not args.files:
+            parser.error("--processes requires FILEs, stdin can't be memory-mapped")
+        total_without_words, total_with_words = sum_all_calibration_numbers_mmap(
+            args.files, args.processes
+        )
+    else:
+        total_without_words, total_with_words = sum_all_calibration_numbers(
+            fileinput.input(args.files)
+        )
+    if args.check:
+        expected = sum_all_calibration_numbers(fileinput.input(args.files))
+        if (total_without_words, total_with_words) != expected:
+            raise ValueError(
+                f"Totals {(total_without_words, total_with_words)} don't match "
+                f"reference totals {expected}"
+            )
+    print(f"Total without words: {total_without_words}")
+    print(f"Total with words: {total_with_words}")
 
 
 if __name__ == "__main__":
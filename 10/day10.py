@@ -2,106 +2,153 @@ import argparse
 import fileinput
 
 
-# (row, col)
+# Pipe connections as bitmasks of directions
+NORTH = 1
+SOUTH = 2
+WEST = 4
+EAST = 8
 pipes_to_dirs = {
-    "|": ((-1, 0), (1, 0)),
-    "-": ((0, -1), (0, 1)),
-    "L": ((-1, 0), (0, 1)),
-    "J": ((-1, 0), (0, -1)),
-    "7": ((0, -1), (1, 0)),
-    "F": ((0, 1), (1, 0)),
+    "|": NORTH | SOUTH,
+    "-": WEST | EAST,
+    "L": NORTH | EAST,
+    "J": NORTH | WEST,
+    "7": SOUTH | WEST,
+    "F": SOUTH | EAST,
 }
-dirs_to_pipes = {val: key for key, val in pipes_to_dirs.items()}
+# Indexed by byte value, so anything that isn't a pipe connects nowhere
+pipe_table = bytes(pipes_to_dirs.get(chr(i), 0) for i in range(256))
+# Indexed by direction bit
+opposites = [0, SOUTH, NORTH, 0, EAST, 0, 0, 0, WEST]
 
 
-GROUND = "."
-START = "S"
-
-
-def find_start(grid):
-    for row, line in enumerate(grid):
-        for col, char in enumerate(line):
-            if char == START:
-                return row, col
+GROUND = ord(".")
+START = ord("S")
 
 
 def parse_grid(lines):
-    grid = []
-    for line in lines:
-        grid.append(list(line.strip()))
-    return grid
-
-
-def calc_start_pipe(grid, start):
-    num_rows = len(grid)
-    num_cols = len(grid[0])
-    connections = []
-    for row in (-1, 0, 1):
-        for col in (-1, 0, 1):
-            if row == 0 and col == 0 or row != 0 and col != 0:
-                continue
-            # If we have a valid non-ground cell, check if it is connected to start
-            if (
-                0 <= start[0] + row < num_rows
-                and 0 <= start[1] + col < num_cols
-                and grid[start[0] + row][start[1] + col] != GROUND
-            ):
-                search_row = start[0] + row
-                search_col = start[1] + col
-                pipe = grid[search_row][search_col]
-                for direction in pipes_to_dirs[pipe]:
-                    if (
-                        search_row + direction[0] == start[0]
-                        and search_col + direction[1] == start[1]
-                    ):
-                        connections.append((row, col))
-    connections = tuple(sorted(connections))
-    return dirs_to_pipes[connections]
-
-
-def next_dirs(pipe, curr_dir):
-    return next(
-        ((row, col) for (row, col) in pipes_to_dirs[pipe] if (-row, -col) != curr_dir),
-        None,
+    """Returns (cells, stride) with the maze as a flat bytearray of rows
+
+    The maze gets a border of ground on every side so moving off a pipe never
+    leaves the bytearray or wraps onto another row.
+    """
+    rows = [line.strip().encode() for line in lines]
+    stride = max(map(len, rows)) + 2
+    cells = bytearray([GROUND]) * stride
+    for row in rows:
+        cells.append(GROUND)
+        cells += row.ljust(stride - 1, b".")
+    cells += bytearray([GROUND]) * stride
+    return cells, stride
+
+
+def find_start(cells):
+    return cells.index(START)
+
+
+def dir_offsets(stride):
+    """Flat offset for moving in each direction, indexed by direction bit"""
+    return [0, -stride, stride, 0, -1, 0, 0, 0, 1]
+
+
+def calc_start_pipe(cells, stride, start):
+    offsets = dir_offsets(stride)
+    connections = 0
+    for direction in (NORTH, SOUTH, WEST, EAST):
+        if pipe_table[cells[start + offsets[direction]]] & opposites[direction]:
+            connections |= direction
+    if connections.bit_count() != 2:
+        raise ValueError(f"Start connects to {connections.bit_count()} pipes, not 2")
+    return connections
+
+
+def trace_loop(cells, stride, start):
+    """Returns (loop length, visited, corners)
+
+    visited has a bit set for every loop cell and corners lists the cells where
+    the loop turns, in the order they are traced.
+    """
+    offsets = dir_offsets(stride)
+    start_dirs = calc_start_pipe(cells, stride, start)
+    visited = bytearray((len(cells) + 7) // 8)
+    corners = [] if start_dirs in (NORTH | SOUTH, WEST | EAST) else [start]
+    direction = start_dirs & -start_dirs
+    pos = start
+    length = 0
+    while True:
+        visited[pos >> 3] |= 1 << (pos & 7)
+        pos += offsets[direction]
+        length += 1
+        if pos == start:
+            return length, visited, corners
+        if visited[pos >> 3] >> (pos & 7) & 1:
+            raise ValueError(f"Loop detected at step {length} at cell {pos}")
+        came_from = opposites[direction]
+        pipe_dirs = pipe_table[cells[pos]]
+        if not pipe_dirs & came_from:
+            raise ValueError(f"Invalid state at step {length}: cell {pos}")
+        if pipe_dirs != came_from | direction:
+            corners.append(pos)
+        direction = pipe_dirs ^ came_from
+
+
+def calc_loop_max_distance(length):
+    return length // 2
+
+
+def calc_enclosed_tiles(stride, length, corners):
+    """Count tiles enclosed by the loop from its area and Pick's theorem
+
+    The shoelace formula over the loop's corners gives the area A of the polygon
+    through the loop's tile centres, which has the B loop tiles on its boundary,
+    so there are A - B / 2 + 1 tiles inside.
+    """
+    points = [divmod(pos, stride) for pos in corners]
+    twice_area = abs(
+        sum(
+            row1 * col2 - row2 * col1
+            for (row1, col1), (row2, col2) in zip(points, points[1:] + points[:1])
+        )
     )
+    return twice_area // 2 - length // 2 + 1
 
 
-def add_dir(pos, direction):
-    return pos[0] + direction[0], pos[1] + direction[1]
-
-
-def calc_loop_max_distance(grid, start):
-    start_pipe = calc_start_pipe(grid, start)
-    grid[start[0]][start[1]] = start_pipe
-
-    distances = {start: 0}
-    curr1_dirs = pipes_to_dirs[start_pipe][0]
-    curr2_dirs = pipes_to_dirs[start_pipe][1]
-    curr1 = add_dir(start, curr1_dirs)
-    curr2 = add_dir(start, curr2_dirs)
-    steps = 1
-    while curr1 != curr2:
-        # print(
-        #     f"Step {steps}: {curr1} {grid[curr1[0]][curr1[1]]}, {curr2} {grid[curr2[0]][curr2[1]]}"
-        # )
-        if curr1 in distances or curr2 in distances:
-            print(f"Loop detected at step {steps} curr1 {curr1} curr2 {curr2}")
-            print(distances)
-            break
-        distances[curr1] = steps
-        distances[curr2] = steps
-        curr1_dirs = next_dirs(grid[curr1[0]][curr1[1]], curr1_dirs)
-        curr2_dirs = next_dirs(grid[curr2[0]][curr2[1]], curr2_dirs)
-        if curr1_dirs is None or curr2_dirs is None:
-            raise ValueError(
-                f"Invalid state at step {steps}: {curr1_dirs}, {curr2_dirs}"
+# b"1" for pipes that connect north, b"0" for everything else
+north_bits = bytes(ord("1") if pipe_table[i] & NORTH else ord("0") for i in range(256))
+
+
+def calc_enclosed_tiles_scanline(cells, stride, start, visited):
+    """Count tiles enclosed by the loop by scanning rows for crossings
+
+    Scanning along a row, we are inside the loop after an odd number of loop
+    tiles that connect north. Each row is handled as int bitmasks, with the
+    running parity computed as a prefix XOR by shifting.
+    """
+    start_row, start_col = divmod(start, stride)
+    start_crosses = calc_start_pipe(cells, stride, start) & NORTH
+    row_mask = (1 << stride) - 1
+    enclosed = 0
+    for row_start in range(0, len(cells), stride):
+        loop = (
+            int.from_bytes(
+                visited[row_start >> 3 : ((row_start + stride) >> 3) + 1], "little"
             )
-        curr1 = add_dir(curr1, curr1_dirs)
-        curr2 = add_dir(curr2, curr2_dirs)
-        steps += 1
-        if curr1 == curr2:
-            distances[curr1] = steps
-    return max(distances.values())
+            >> (row_start & 7)
+            & row_mask
+        )
+        if not loop:
+            continue
+        row = cells[row_start : row_start + stride]
+        # Reverse so column 0 ends up as the least significant bit
+        crossings = int(row.translate(north_bits)[::-1], 2) & loop
+        if row_start // stride == start_row and start_crosses:
+            crossings |= 1 << start_col
+        inside = crossings
+        shift = 1
+        while shift < stride:
+            inside ^= inside << shift
+            shift *= 2
+        enclosed += (inside & ~loop & row_mask).bit_count()
+    return enclosed
 
 
 def main():
@@ -112,15 +159,28 @@ def main():
         nargs="*",
         help="Files to read. If empty, stdin is used.",
     )
+    parser.add_argument(
+        "--scanline",
+        action="store_true",
+        help="Also count enclosed tiles by scanning rows and check both counts match.",
+    )
     args = parser.parse_args()
     lines = list(fileinput.input(args.files))
     print(f"Num lines: {len(lines)}")
-    grid = parse_grid(lines)
-    # print(f"Grid: {grid}")
-    start = find_start(grid)
-    # print(f"Start: {start}")
-    max_loop_distance = calc_loop_max_distance(grid, start)
+    cells, stride = parse_grid(lines)
+    start = find_start(cells)
+    length, visited, corners = trace_loop(cells, stride, start)
+    max_loop_distance = calc_loop_max_distance(length)
     print(f"Max loop distance: {max_loop_distance}")
+    enclosed_tiles = calc_enclosed_tiles(stride, length, corners)
+    print(f"Enclosed tiles: {enclosed_tiles}")
+    if args.scanline:
+        scanline_tiles = calc_enclosed_tiles_scanline(cells, stride, start, visited)
+        print(f"Enclosed tiles (scanline): {scanline_tiles}")
+        if scanline_tiles != enclosed_tiles:
+            raise ValueError(
+                f"Scanline count {scanline_tiles} doesn't match {enclosed_tiles}"
+            )
 
 
 if __name__ == "__main__":
@@ -1,59 +1,100 @@
 import argparse
 import fileinput
-import itertools
+from itertools import accumulate, count
+from operator import mul
 
 
-def parse_grid(lines):
-    grid = []
+def echo_lines(lines):
+    """Print lines as they are read and pass them on"""
     for line in lines:
-        grid.append(list(line.strip()))
-    return grid
+        print(line.rstrip("\n"))
+        yield line
+
+
+def scan_universe(lines):
+    """Returns (num_rows, galaxies, empty_rows, empty_cols) from one pass over lines
+
+    Only the galaxies, the empty rows and a byte per column saying whether it
+    has a galaxy are kept, never the grid itself.
+    """
+    galaxies = []
+    empty_rows = []
+    occupied_cols = bytearray()
+    num_rows = 0
+    for row, line in enumerate(lines):
+        line = line.strip()
+        num_rows += 1
+        if len(line) > len(occupied_cols):
+            occupied_cols.extend(bytes(len(line) - len(occupied_cols)))
+        col = line.find("#")
+        if col < 0:
+            empty_rows.append(row)
+        while col >= 0:
+            galaxies.append((row, col))
+            occupied_cols[col] = 1
+            col = line.find("#", col + 1)
+    empty_cols = [col for col, occupied in enumerate(occupied_cols) if not occupied]
+    return num_rows, galaxies, empty_rows, empty_cols
+
+
+def count_empty_before(empty, size):
+    """Returns counts where counts[i] is the number of lines in empty before i"""
+    flags = bytearray(size)
+    for line in empty:
+        if line < size:
+            flags[line] = 1
+    return list(accumulate(flags, initial=0))
 
 
-def print_grid(grid):
-    for line in grid:
-        print("".join(line))
+def shift_galaxies(galaxies, empty_rows, empty_cols, multiplier):
+    if not galaxies:
+        return []
+    rows_before = count_empty_before(empty_rows, max(row for row, _ in galaxies))
+    cols_before = count_empty_before(empty_cols, max(col for _, col in galaxies))
+    return [
+        (
+            row + rows_before[row] * (multiplier - 1),
+            col + cols_before[col] * (multiplier - 1),
+        )
+        for row, col in galaxies
+    ]
 
 
-def find_empty_rows_cols(grid):
-    empty_rows = [
-        row for row, line in enumerate(grid) if all(char == "." for char in line)
-    ]
-    empty_cols = [
-        col for col in range(len(grid[0])) if all(line[col] == "." for line in grid)
-    ]
-    return empty_rows, empty_cols
+def sum_pairwise_distances(coords):
+    """Sum of |a - b| over all pairs of coords
 
+    Once sorted, each coord is subtracted from every coord after it and has
+    every coord before it subtracted from it.
+    """
+    coords = sorted(coords)
+    return sum(map(mul, coords, count())) - sum(accumulate(coords[:-1]))
 
-def shift_galaxies(galaxies, empty_rows, empty_cols, multiplier):
-    new_galaxies = []
-    for galaxy in galaxies:
-        row, col = galaxy
-        row_shift = sum(row > empty_row for empty_row in empty_rows) * (multiplier - 1)
-        col_shift = sum(col > empty_col for empty_col in empty_cols) * (multiplier - 1)
-        galaxy = (row + row_shift, col + col_shift)
-        new_galaxies.append(galaxy)
-    return new_galaxies
 
+def sum_shortest_paths(galaxies):
+    """Sum of Manhattan distances between all pairs of galaxies"""
+    rows = (row for row, _ in galaxies)
+    cols = (col for _, col in galaxies)
+    return sum_pairwise_distances(rows) + sum_pairwise_distances(cols)
 
-def find_galaxies(grid):
-    return [
-        (row, col)
-        for row, line in enumerate(grid)
-        for col, char in enumerate(line)
-        if char == "#"
-    ]
 
+def expansion_coefficients(galaxies, empty_rows, empty_cols):
+    """Returns (base, crossed) for answering queries with sum_paths_for_multipliers
 
-def manhattan_distance(a, b):
-    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+    base is the sum of shortest paths before expansion and crossed is the total
+    number of empty lines those paths cross, so with a multiplier m the sum of
+    shortest paths is base + crossed * (m - 1).
+    """
+    base = sum_shortest_paths(galaxies)
+    # Expansion never reorders galaxies along an axis, so doubling each empty
+    # line adds exactly the empty lines crossed to the sum
+    doubled = sum_shortest_paths(shift_galaxies(galaxies, empty_rows, empty_cols, 2))
+    return base, doubled - base
 
 
-def sum_shortest_paths(galaxies):
-    return sum(
-        manhattan_distance(galaxy1, galaxy2)
-        for galaxy1, galaxy2 in itertools.combinations(galaxies, 2)
-    )
+def sum_paths_for_multipliers(coefficients, multipliers):
+    """Sum of shortest paths for each multiplier, from expansion_coefficients"""
+    base, crossed = coefficients
+    return [base + crossed * (multiplier - 1) for multiplier in multipliers]
 
 
 def main():
@@ -64,21 +105,35 @@ def main():
         nargs="*",
         help="Files to read. If empty, stdin is used.",
     )
-    parser.add_argument("--multiplier", "-m", type=int, default=2, help="Multiplier")
-    args = parser.parse_args()
-    lines = list(fileinput.input(args.files))
-    print(f"Num lines: {len(lines)}")
-    grid = parse_grid(lines)
-    print_grid(grid)
-    empty_rows, empty_cols = find_empty_rows_cols(grid)
-    print(f"Empty rows: {empty_rows}")
-    print(f"Empty cols: {empty_cols}")
-    galaxies = find_galaxies(grid)
-    shifted_galaxies = shift_galaxies(
-        galaxies, empty_rows, empty_cols, multiplier=args.multiplier
+    parser.add_argument(
+        "--multiplier",
+        "-m",
+        type=int,
+        action="append",
+        help="Multiplier. Can be given several times. Defaults to 2.",
+    )
+    parser.add_argument(
+        "--verbose",
+        "-v",
+        action="store_true",
+        help="Print the grid, empty lines and galaxies.",
     )
-    print(f"Shifted Galaxies: {shifted_galaxies}")
-    print(f"Sum shortest paths: {sum_shortest_paths(shifted_galaxies)}")
+    args = parser.parse_args()
+    lines = fileinput.input(args.files)
+    if args.verbose:
+        lines = echo_lines(lines)
+    num_rows, galaxies, empty_rows, empty_cols = scan_universe(lines)
+    print(f"Num lines: {num_rows}")
+    if args.verbose:
+        print(f"Empty rows: {empty_rows}")
+        print(f"Empty cols: {empty_cols}")
+        print(f"Galaxies: {galaxies}")
+    multipliers = args.multiplier or [2]
+    coefficients = expansion_coefficients(galaxies, empty_rows, empty_cols)
+    for multiplier, total in zip(
+        multipliers, sum_paths_for_multipliers(coefficients, multipliers)
+    ):
+        print(f"Sum shortest paths (multiplier {multiplier}): {total}")
 
 
 if __name__ == "__main__":
@@ -1,44 +1,107 @@
 import argparse
+from array import array
+from bisect import bisect_right
 from collections import Counter
 import fileinput
+from itertools import compress
 from math import prod
+from operator import le
 
 
 def parse_line(line):
-    """Game line -> (id, pulls) where pulls is a list of Counter of color -> number"""
+    """Game line -> (id, maxes) where maxes is a dict of color -> max number pulled"""
     id_chunk, pulls_chunk = line.split(": ")
     game_id = int(id_chunk[4:])
-    pulls = [
-        Counter(
-            {
-                color_number.split(" ")[1]: int(color_number.split(" ")[0])
-                for color_number in pull.split(", ")
-            }
-        )
-        for pull in pulls_chunk.split("; ")
-    ]
-    return game_id, pulls
+    maxes = {}
+    for pull in pulls_chunk.split("; "):
+        for color_number in pull.split(", "):
+            number, color = color_number.split(" ")
+            number = int(number)
+            if number > maxes.get(color, 0):
+                maxes[color] = number
+    return game_id, maxes
 
 
-def calculate_possible_games(lines, possible_for):
-    possible_games = set()
+def parse_games(lines):
+    """Game lines -> (game_ids, columns)
+
+    game_ids is an array of game IDs and columns is a dict of color -> array of
+    the max number of that color pulled in each game, in the same order.
+    """
+    game_ids = array("Q")
+    columns = {}
     for line in lines:
-        game_id, pulls = parse_line(line.strip())
-        if all(pull <= possible_for for pull in pulls):
-            possible_games.add(game_id)
-    return possible_games
+        game_id, maxes = parse_line(line.strip())
+        for color in maxes.keys() - columns.keys():
+            columns[color] = array("Q", [0]) * len(game_ids)
+        game_ids.append(game_id)
+        for color, column in columns.items():
+            column.append(maxes.get(color, 0))
+    return game_ids, columns
 
 
-def calculate_cube_powers(lines):
-    game_powers = {}
-    for line in lines:
-        game_id, pulls = parse_line(line.strip())
-        min_counter = Counter()
-        for pull in pulls:
-            for color, number in pull.items():
-                min_counter[color] = max(min_counter[color], number)
-        game_powers[game_id] = prod(min_counter.values())
-    return game_powers
+def calculate_possible_games(games, possible_for):
+    game_ids, columns = games
+    possible = [True] * len(game_ids)
+    for color, column in columns.items():
+        fits = map(le, column, [possible_for.get(color, 0)] * len(column))
+        possible = map(min, possible, fits)
+    return set(compress(game_ids, possible))
+
+
+def calculate_cube_powers(games):
+    game_ids, columns = games
+    # Colors never pulled in a game don't count towards its power
+    powers = (prod(filter(None, maxes)) for maxes in zip(*columns.values()))
+    return dict(zip(game_ids, powers))
+
+
+def build_possible_id_index(games):
+    """Sort the games by each color for answering many possible_for queries
+
+    Returns a dict of color -> (values, game_ids, columns), where values is the
+    sorted max values of that color, and game_ids and columns (color -> array of
+    maxes) are in the same order. This takes O(games * colors ** 2) space.
+    """
+    game_ids, columns = games
+    index = {}
+    for color, column in columns.items():
+        order = sorted(range(len(game_ids)), key=column.__getitem__)
+        index[color] = (
+            array("Q", map(column.__getitem__, order)),
+            array("Q", map(game_ids.__getitem__, order)),
+            {
+                other: array("Q", map(other_column.__getitem__, order))
+                for other, other_column in columns.items()
+                if other != color
+            },
+        )
+    return index
+
+
+def sum_possible_game_ids(games, bags):
+    """Return sum of IDs of games that are possible for each bag in bags
+
+    For each bag only the games that fit the bag's most limiting color are
+    checked against the other colors, which are found with one bisect per color.
+    """
+    index = build_possible_id_index(games)
+    if not index:
+        # No colors were ever pulled, so every game is possible
+        return [sum(games[0])] * len(bags)
+    results = []
+    for bag in bags:
+        num_fits, color = min(
+            (bisect_right(values, bag.get(color, 0)), color)
+            for color, (values, _, _) in index.items()
+        )
+        _, game_ids, columns = index[color]
+        possible = [True] * num_fits
+        for other, column in columns.items():
+            limits = [bag.get(other, 0)] * num_fits
+            possible = map(min, possible, map(le, column[:num_fits], limits))
+        results.append(sum(compress(game_ids[:num_fits], possible)))
+    return results
 
 
 def main():
@@ -50,13 +113,13 @@ def main():
         help="Files to read. If empty, stdin is used.",
     )
     args = parser.parse_args()
-    lines = list(fileinput.input(args.files))
+    games = parse_games(fileinput.input(args.files))
     possible_for = Counter({"red": 12, "green": 13, "blue": 14})
     print(f"Set of cubes we are testing for: {possible_for}")
-    possible_games = calculate_possible_games(lines, possible_for)
+    possible_games = calculate_possible_games(games, possible_for)
     print(f"Possible games with that set: {possible_games}")
     print(f"Sum of IDs: {sum(possible_games)}")
-    cube_powers = calculate_cube_powers(lines)
+    cube_powers = calculate_cube_powers(games)
     print(f"Cube power sum: {sum(cube_powers.values())}")
 
 
@@ -1,7 +1,11 @@
 import argparse
+from array import array
+from collections import Counter, deque
 from enum import StrEnum
 import fileinput
+from itertools import chain
 import math
+import re
 
 
 class EngineSymbol(StrEnum):
@@ -18,83 +22,236 @@ class EngineSymbol(StrEnum):
 
 
 def parse_input_file(lines):
-    """Return a grid of entire input file and a list of all EngineSymbol locations"""
+    """Return a grid of entire input file, a list of all EngineSymbol locations and
+    a number span index
+
+    The span index is a tuple of parallel arrays (rows, starts, ends, values) with
+    one entry per number in the file. Grid cells covered by a number hold the
+    index of its span, so two equal numbers next to each other stay distinct.
+    """
     print(f"Number of lines in file: {len(lines)}")
     grid = []
     engine_symbols = []
+    spans = (array("L"), array("L"), array("L"), array("Q"))
+    span_rows, span_starts, span_ends, span_values = spans
     for row_num, line in enumerate(lines):
-        # Don't strip the line to make handling end of number simpler
+        line = line.rstrip("\n")
         num_start = None
         row = []
-        for col_num, char in enumerate(line):
+        # Trailing "." makes handling a number at the end of the line simpler
+        for col_num, char in enumerate(line + "."):
             if char.isdigit():
                 if num_start is None:
                     num_start = col_num
+                continue
+            if num_start is not None:
+                row.extend([len(span_values)] * (col_num - num_start))
+                span_rows.append(row_num)
+                span_starts.append(num_start)
+                span_ends.append(col_num)
+                span_values.append(int(line[num_start:col_num]))
+                num_start = None
+            if col_num == len(line):
+                break
+            if char == ".":
+                row.append(None)
             else:
-                if num_start is not None:
-                    num = int(line[num_start:col_num])
-                    row.extend([num] * (col_num - num_start))
-                    num_start = None
-                if char == ".":
-                    row.append(None)
-                elif char == "\n":
-                    continue
-                else:
-                    row.append(EngineSymbol(char))
-                    engine_symbols.append((row_num, col_num))
+                row.append(EngineSymbol(char))
+                engine_symbols.append((row_num, col_num))
         grid.append(row)
 
-    return grid, engine_symbols
+    return grid, engine_symbols, spans
+
+
+def get_adjacent_spans(grid, i, j):
+    """Return IDs of the number spans adjacent to grid[i][j]"""
+    adjacent_spans = []
+    for i_adj in range(max(i - 1, 0), min(i + 2, len(grid))):
+        row = grid[i_adj]
+        prev_span = None
+        for j_adj in range(max(j - 1, 0), min(j + 2, len(row))):
+            span = row[j_adj]
+            # A span covers consecutive cells, so it only repeats within a row
+            if isinstance(span, int) and span != prev_span:
+                adjacent_spans.append(span)
+            prev_span = span
+    return adjacent_spans
 
 
-def get_all_part_numbers(grid, engine_symbols):
+def get_all_part_numbers(grid, engine_symbols, spans):
     """Part numbers are numbers in the grid that are adjacent to EngineSymbols"""
-    part_numbers = []
-    num_rows = len(grid)
-    num_cols = len(grid[0])
+    span_values = spans[3]
+    is_part = bytearray(len(span_values))
     for i, j in engine_symbols:
-        # Look for numbers adjacent to EngineSymbols
-        adjacent_numbers = set()
-        for i_offset in range(-1, 2):
-            for j_offset in range(-1, 2):
-                i_adj = i + i_offset
-                j_adj = j + j_offset
-                if (
-                    0 <= i_adj < num_rows
-                    and 0 <= j_adj < num_cols
-                    and isinstance(grid[i_adj][j_adj], int)
-                ):
-                    adjacent_numbers.add(grid[i_adj][j_adj])
-        part_numbers.extend(adjacent_numbers)
-    return part_numbers
+        for span in get_adjacent_spans(grid, i, j):
+            is_part[span] = 1
+    return [value for value, part in zip(span_values, is_part) if part]
 
 
-def get_all_gear_ratios(grid, engine_symbols):
+def get_all_gear_ratios(grid, engine_symbols, spans):
     """Gear ratio is product of two numbers adjacvent to EngineSymbol.GEAR"""
-    gear_symbols = [
-        (row, col) for row, col in engine_symbols if grid[row][col] == EngineSymbol.GEAR
+    span_values = spans[3]
+    gear_ratios = []
+    for i, j in engine_symbols:
+        if grid[i][j] != EngineSymbol.GEAR:
+            continue
+        adjacent_spans = get_adjacent_spans(grid, i, j)
+        if len(adjacent_spans) == 2:
+            gear_ratios.append(math.prod(span_values[span] for span in adjacent_spans))
+    return gear_ratios
+
+
+# Bitmask engine
+
+# Translation tables mapping each byte to b"1" if it is in the mask, else b"0"
+symbol_bits = bytes(
+    ord("1") if chr(i) in {symbol.value for symbol in EngineSymbol} else ord("0")
+    for i in range(256)
+)
+gear_bits = bytes(
+    ord("1") if chr(i) == EngineSymbol.GEAR else ord("0") for i in range(256)
+)
+number_pattern = re.compile(rb"\d+")
+
+
+def row_mask(row, bits):
+    """Bytes row -> int with bit col set where bits maps row[col] to b"1"""
+    # Reverse so column 0 ends up as the least significant bit
+    return int(row.translate(bits)[::-1] or b"0", 2)
+
+
+def grow(mask):
+    """Grow every set bit in a row mask to its left and right neighbours"""
+    return mask | mask << 1 | mask >> 1
+
+
+def dilate(masks):
+    """Grow every set bit in a list of row masks to its 3x3 neighbourhood"""
+    grown = [grow(mask) for mask in masks]
+    return [
+        (grown[i - 1] if i else 0)
+        | grown[i]
+        | (grown[i + 1] if i + 1 < len(grown) else 0)
+        for i in range(len(grown))
     ]
-    num_rows = len(grid)
-    num_cols = len(grid[0])
+
+
+def scan_row(row, near_symbols, near_gears, adjacent_gears, gear_counts, gear_products):
+    """Return the part numbers in row and tally the gears they touch
+
+    near_symbols and near_gears are the dilated masks for row, and adjacent_gears
+    is a list of (gear_row_num, gear_mask) for the rows around it.
+    """
+    part_numbers = []
+    for match in number_pattern.finditer(row):
+        start, end = match.span()
+        span = ((1 << (end - start)) - 1) << start
+        if not near_symbols & span:
+            continue
+        number = int(match[0])
+        part_numbers.append(number)
+        if not near_gears & span:
+            continue
+        window = grow(span)
+        for gear_row_num, gear_mask in adjacent_gears:
+            touching = gear_mask & window
+            while touching:
+                gear = (gear_row_num, (touching & -touching).bit_length() - 1)
+                gear_counts[gear] += 1
+                gear_products[gear] = gear_products.get(gear, 1) * number
+                touching &= touching - 1
+    return part_numbers
+
+
+def pop_gear_ratios(gear_row_num, gear_mask, gear_counts, gear_products):
+    """Remove the gears in a row from the tallies and return their gear ratios"""
     gear_ratios = []
-    for i, j in gear_symbols:
-        # Look for numbers adjacent to EngineSymbols
-        adjacent_numbers = set()
-        for i_offset in range(-1, 2):
-            for j_offset in range(-1, 2):
-                i_adj = i + i_offset
-                j_adj = j + j_offset
-                if (
-                    0 <= i_adj < num_rows
-                    and 0 <= j_adj < num_cols
-                    and isinstance(grid[i_adj][j_adj], int)
-                ):
-                    adjacent_numbers.add(grid[i_adj][j_adj])
-        if len(adjacent_numbers) == 2:
-            gear_ratios.append(math.prod(adjacent_numbers))
+    while gear_mask:
+        gear = (gear_row_num, (gear_mask & -gear_mask).bit_length() - 1)
+        if gear_counts.pop(gear, 0) == 2:
+            gear_ratios.append(gear_products[gear])
+        gear_products.pop(gear, None)
+        gear_mask &= gear_mask - 1
     return gear_ratios
 
 
+def get_part_numbers_and_gear_ratios(lines):
+    """Find part numbers and gear ratios with each row stored as int bitmasks
+
+    Rows are kept as bytes, symbol and gear locations become one int bitmask per
+    row, and those masks are dilated so a number is a part number iff its span
+    mask overlaps the dilated symbol mask. Gears touched by a number are found
+    from the same span in the same pass.
+    """
+    rows = [line.rstrip("\n").encode() for line in lines]
+    near_symbols = dilate([row_mask(row, symbol_bits) for row in rows])
+    gears = [row_mask(row, gear_bits) for row in rows]
+    near_gears = dilate(gears)
+    part_numbers = []
+    gear_counts = Counter()
+    gear_products = {}
+    for row_num, row in enumerate(rows):
+        adjacent_gears = [
+            (gear_row_num, gears[gear_row_num])
+            for gear_row_num in range(max(row_num - 1, 0), min(row_num + 2, len(rows)))
+        ]
+        part_numbers.extend(
+            scan_row(
+                row,
+                near_symbols[row_num],
+                near_gears[row_num],
+                adjacent_gears,
+                gear_counts,
+                gear_products,
+            )
+        )
+    gear_ratios = []
+    for gear_row_num, gear_mask in enumerate(gears):
+        gear_ratios.extend(
+            pop_gear_ratios(gear_row_num, gear_mask, gear_counts, gear_products)
+        )
+    return part_numbers, gear_ratios
+
+
+def stream_part_numbers_and_gear_ratios(lines):
+    """Yield (part_numbers, gear_ratios) while keeping only three rows in memory
+
+    The part numbers for a row are yielded once the row below it has been read,
+    together with the gear ratios for the row above it, since no later row can
+    touch those gears.
+    """
+    # (row_num, row, symbol_mask, gear_mask), padded with empty rows at both ends
+    window = deque([(-1, b"", 0, 0)], maxlen=3)
+    gear_counts = Counter()
+    gear_products = {}
+    for row_num, line in enumerate(chain(lines, ["", ""])):
+        row = line.rstrip("\n").encode()
+        window.append(
+            (row_num, row, row_mask(row, symbol_bits), row_mask(row, gear_bits))
+        )
+        if len(window) < 3:
+            continue
+        (above_num, _, above_symbols, above_gears), middle, below = window
+        middle_num, middle_row, middle_symbols, middle_gears = middle
+        _, _, below_symbols, below_gears = below
+        part_numbers = scan_row(
+            middle_row,
+            grow(above_symbols | middle_symbols | below_symbols),
+            grow(above_gears | middle_gears | below_gears),
+            [
+                (above_num, above_gears),
+                (middle_num, middle_gears),
+                (row_num, below_gears),
+            ],
+            gear_counts,
+            gear_products,
+        )
+        gear_ratios = pop_gear_ratios(
+            above_num, above_gears, gear_counts, gear_products
+        )
+        yield part_numbers, gear_ratios
+
+
 def main():
     parser = argparse.ArgumentParser(description="Day 3: Cube Conundrum")
     parser.add_argument(
@@ -103,14 +260,35 @@ def main():
         nargs="*",
         help="Files to read. If empty, stdin is used.",
     )
+    parser.add_argument(
+        "--engine",
+        "-e",
+        choices=("grid", "bitmask", "stream"),
+        default="bitmask",
+        help="How to search the schematic.",
+    )
     args = parser.parse_args()
+    if args.engine == "stream":
+        part_sum = 0
+        gear_ratio_sum = 0
+        for part_numbers, gear_ratios in stream_part_numbers_and_gear_ratios(
+            fileinput.input(args.files)
+        ):
+            part_sum += sum(part_numbers)
+            gear_ratio_sum += sum(gear_ratios)
+        print(f"Sum of part numbers: {part_sum}")
+        print(f"Sum of gear ratios: {gear_ratio_sum}")
+        return
     lines = list(fileinput.input(args.files))
-    grid, engine_symbols = parse_input_file(lines)
-    part_numbers = get_all_part_numbers(grid, engine_symbols)
-    print(f"Engine symbols: {engine_symbols}")
+    if args.engine == "grid":
+        grid, engine_symbols, spans = parse_input_file(lines)
+        part_numbers = get_all_part_numbers(grid, engine_symbols, spans)
+        print(f"Engine symbols: {engine_symbols}")
+        gear_ratios = get_all_gear_ratios(grid, engine_symbols, spans)
+    else:
+        part_numbers, gear_ratios = get_part_numbers_and_gear_ratios(lines)
     print(f"Part numbers: {part_numbers}")
     print(f"Sum of part numbers: {sum(part_numbers)}")
-    gear_ratios = get_all_gear_ratios(grid, engine_symbols)
     print(f"Gear ratios: {gear_ratios}")
     print(f"Sum of gear ratios: {sum(gear_ratios)}")
 
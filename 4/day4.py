@@ -1,38 +1,81 @@
 import argparse
-from collections import Counter
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import fileinput
+from itertools import islice
+
+
+def parse_numbers(numbers):
+    """Whitespace separated numbers -> int bitmask with those bits set"""
+    mask = 0
+    for number in numbers.split():
+        mask |= 1 << int(number)
+    return mask
 
 
 def parse_line(line):
-    """Card line -> (winners, given)"""
+    """Card line -> (card_id, winners, scratched) with numbers as bitmasks"""
     id_chunk, numbers_chunk = line.split(": ")
     card_id = int(id_chunk[4:])
     winners, scratched = numbers_chunk.split(" | ")
-    winners = {int(winner) for winner in winners.split()}
-    scratched = {int(winner) for winner in scratched.split()}
-    return card_id, winners, scratched
+    return card_id, parse_numbers(winners), parse_numbers(scratched)
+
+
+def parse_match_counts(lines):
+    """Yield the number of winning numbers scratched on each card"""
+    for line in lines:
+        _, winners, scratched = parse_line(line)
+        yield (winners & scratched).bit_count()
+
+
+def count_matches_chunk(lines):
+    return array("H", parse_match_counts(lines))
+
 
+def parallel_match_counts(lines, processes, chunk_size=10_000):
+    """Yield match counts in card order, counting chunks of lines in a process pool
 
-def parse_cards(lines):
-    return {
-        card_id: (winners, scratched)
-        for card_id, winners, scratched in (parse_line(line) for line in lines)
-    }
+    Only a couple of chunks per process are in flight at a time, so lines are
+    read no faster than the workers can count them.
+    """
+    lines = iter(lines)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        in_flight = deque()
+        while chunk := list(islice(lines, chunk_size)):
+            in_flight.append(executor.submit(count_matches_chunk, chunk))
+            if len(in_flight) >= processes * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
 
 
-def score_card_simple(winners, scratched):
-    num_matches = len(winners & scratched)
+def score_card_simple(num_matches):
     return 2 ** (num_matches - 1) if num_matches > 0 else 0
 
 
-def count_duplicated_cards(cards):
-    copies = Counter()
-    for card_id, (winners, scratched) in cards.items():
-        num_matches = len(winners & scratched)
-        copies[card_id] += 1
-        for i in range(1, num_matches + 1):
-            copies[card_id + i] += copies[card_id]
-    return copies.total()
+def score_cards(match_counts):
+    """Returns (total score, card count with duplication) in one pass"""
+    total_score = 0
+    total_cards = 0
+    # pending[k] is the change in copies won for the card k after the current one
+    pending = deque()
+    copies_won = 0
+    for num_matches in match_counts:
+        total_score += score_card_simple(num_matches)
+        if pending:
+            copies_won += pending.popleft()
+        copies = copies_won + 1
+        total_cards += copies
+        if num_matches:
+            pending.extend([0] * (num_matches + 1 - len(pending)))
+            pending[0] += copies
+            pending[num_matches] -= copies
+    return total_score, total_cards
+
+
+def count_duplicated_cards(match_counts):
+    return score_cards(match_counts)[1]
 
 
 def main():
@@ -43,14 +86,27 @@ def main():
         nargs="*",
         help="Files to read. If empty, stdin is used.",
     )
-    args = parser.parse_args()
-    lines = list(fileinput.input(args.files))
-    cards = parse_cards(lines)
-    total_score = sum(
-        score_card_simple(winners, scratched) for winners, scratched in cards.values()
+    parser.add_argument(
+        "--processes",
+        "-p",
+        type=int,
+        help="Count matches in this many worker processes.",
     )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=10_000,
+        help="Number of cards sent to a worker process at a time.",
+    )
+    args = parser.parse_args()
+    lines = fileinput.input(args.files)
+    if args.processes:
+        match_counts = parallel_match_counts(lines, args.processes, args.chunk_size)
+    else:
+        match_counts = parse_match_counts(lines)
+    total_score, total_cards = score_cards(match_counts)
     print(f"Total score: {total_score}")
-    print(f"Card count with duplication: {count_duplicated_cards(cards)}")
+    print(f"Card count with duplication: {total_cards}")
 
 
 if __name__ == "__main__":
@@ -1,12 +1,29 @@
 import argparse
+from array import array
+from bisect import bisect_right
+from collections import Counter
 import fileinput
+import hashlib
+from itertools import repeat
+from operator import add
+import os
 
 
 # Part 1
 
 
-def parse_almanac(lines, use_seed_ranges=False):
-    seeds = set()
+def parse_seeds(line):
+    """Seeds line -> list of numbers"""
+    return [int(num) for num in line[7:].split()]
+
+
+def seed_ranges(seeds):
+    """Pair up seed numbers into a set of (start, length) ranges"""
+    return set(zip(seeds[::2], seeds[1::2]))
+
+
+def parse_almanac(lines):
+    seeds = []
     mappings = {}
     current_mapping = {}
     name = None
@@ -15,12 +32,7 @@ def parse_almanac(lines, use_seed_ranges=False):
         if not line:
             continue
         if line.startswith("seeds:"):
-            numbers = [int(num) for num in line[7:].split()]
-            if use_seed_ranges:
-                for start, length in zip(numbers[::2], numbers[1::2]):
-                    seeds.add((start, length))
-            else:
-                seeds.update(numbers)
+            seeds = parse_seeds(line)
         elif not line[0].isdigit():
             if name is None:
                 name = line.split()[0]
@@ -35,90 +47,224 @@ def parse_almanac(lines, use_seed_ranges=False):
     return seeds, mappings
 
 
-def location_for_seed(seed, almanac):
-    category = "seed"
-    src_num = seed
-    # print(f"{category.title()}: {src_num}", end=", ")
-    while category != "location":
-        name, mapping = next(
-            (
-                (name, mapping)
-                for name, mapping in almanac.items()
-                if name.startswith(category)
-            ),
-            (None, None),
-        )
-        if name is None or mapping is None:
+def chain_mappings(mappings, category="seed", target="location"):
+    """Return the mappings from category to target in the order they apply"""
+    by_source = {name.split("-")[0]: name for name in mappings}
+    chain = []
+    while category != target:
+        name = by_source.get(category)
+        if name is None:
             raise ValueError(f"Unknown category: {category}")
-        for (src_start, src_end), delta in mapping.items():
-            if src_start <= src_num < src_end:
-                src_num += delta
-                break
+        chain.append(mappings[name])
         category = name.split("-")[-1]
-    #     print(f"{category.title()}: {src_num}", end=", ")
-    # print()
-    return src_num
+    return chain
+
+
+def add_piece(breakpoints, deltas, start, delta):
+    """Append a piece to a piecewise-linear function, merging equal neighbours"""
+    if deltas and deltas[-1] == delta:
+        return
+    breakpoints.append(start)
+    deltas.append(delta)
+
+
+def compile_mapping(mapping):
+    """Mapping dict -> (breakpoints, deltas) piecewise-linear function
+
+    Numbers in [breakpoints[i], breakpoints[i + 1]) map to number + deltas[i], and
+    the last piece extends forever.
+    """
+    breakpoints = [0]
+    deltas = [0]
+    prev_end = 0
+    for (src_start, src_end), delta in sorted(mapping.items()):
+        if src_start < prev_end:
+            raise ValueError(f"Overlapping ranges in mapping at {src_start}")
+        if src_start == breakpoints[-1]:
+            # Replace the gap piece added after the previous range
+            breakpoints.pop()
+            deltas.pop()
+        add_piece(breakpoints, deltas, src_start, delta)
+        add_piece(breakpoints, deltas, src_end, 0)
+        prev_end = src_end
+    return breakpoints, deltas
+
+
+def compose(first, second):
+    """Piecewise-linear function for applying first and then second"""
+    first_breakpoints, first_deltas = first
+    second_breakpoints, second_deltas = second
+    breakpoints = []
+    deltas = []
+    for i, (start, delta) in enumerate(zip(first_breakpoints, first_deltas)):
+        end = first_breakpoints[i + 1] if i + 1 < len(first_breakpoints) else None
+        # Split this piece wherever its image crosses a breakpoint of second
+        j = bisect_right(second_breakpoints, start + delta) - 1
+        while True:
+            add_piece(breakpoints, deltas, start, delta + second_deltas[j])
+            j += 1
+            if j == len(second_breakpoints):
+                break
+            start = second_breakpoints[j] - delta
+            if end is not None and start >= end:
+                break
+    return breakpoints, deltas
+
+
+def compile_almanac(mappings):
+    """Compose the seed -> location chain of mappings into one function"""
+    almanac = compile_mapping({})
+    for mapping in chain_mappings(mappings):
+        almanac = compose(almanac, compile_mapping(mapping))
+    return almanac
+
+
+def location_for_seed(seed, almanac):
+    breakpoints, deltas = almanac
+    return seed + deltas[bisect_right(breakpoints, seed) - 1]
+
+
+def locations_for_seeds(seeds, almanac):
+    """Look up many seeds at once -> (array of locations, lowest location)
+
+    Equivalent to calling location_for_seed on every seed, but the bisects and
+    delta lookups are chained maps, so no Python code runs per seed.
+    """
+    breakpoints, deltas = almanac
+    seeds = array("q", seeds)
+    # bisect_right returns the index after the matching piece, so shift by one
+    piece_deltas = [None, *deltas]
+    locations = array(
+        "q",
+        map(
+            add,
+            seeds,
+            map(
+                piece_deltas.__getitem__,
+                map(bisect_right, repeat(breakpoints), seeds),
+            ),
+        ),
+    )
+    return locations, min(locations)
 
 
 def find_lowest_seed_location(seeds, almanac):
-    return min(location_for_seed(seed, almanac) for seed in seeds)
+    return locations_for_seeds(seeds, almanac)[1]
 
 
 # Part 2
 
 
-def apply_mapping(ranges, mapping):
-    new_ranges = set()
+def coalesce(intervals):
+    """Sort (start, end) intervals and merge any that overlap or touch"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
 
-    for src_start, length in sorted(ranges):
-        src_end = src_start + length
-        for (curr_start, curr_end), curr_delta in sorted(mapping.items()):
-            if curr_start >= src_end:
-                break
-            if curr_end <= src_start:
-                continue
-            overlap_start = max(src_start, curr_start)
-            overlap_end = min(src_end, curr_end)
-            if overlap_start >= overlap_end:
-                raise ValueError(
-                    f"Overlap start {overlap_start} >= overlap end {overlap_end}"
-                )
-            # pre-overlap
-            if src_start < curr_start:
-                new_ranges.add((src_start, curr_start - src_start))
-            # overlap
-            new_ranges.add((overlap_start + curr_delta, overlap_end - overlap_start))
-            src_start = overlap_end
-        if src_start > src_end:
-            raise ValueError(f"src_start {src_start} > src_end {src_end}")
-        if src_start < src_end:
-            new_ranges.add((src_start, src_end - src_start))
-    new_ranges = sorted(new_ranges)
-    return new_ranges
+
+def apply_mapping(intervals, mapping):
+    """Map coalesced (start, end) intervals through a compiled mapping
+
+    Both the intervals and the mapping's breakpoints are sorted, so this is a
+    single sweep over the two before coalescing the result.
+    """
+    breakpoints, deltas = mapping
+    mapped = []
+    j = 0
+    for start, end in intervals:
+        while j + 1 < len(breakpoints) and breakpoints[j + 1] <= start:
+            j += 1
+        while start < end:
+            piece_end = end
+            if j + 1 < len(breakpoints) and breakpoints[j + 1] < end:
+                piece_end = breakpoints[j + 1]
+            mapped.append((start + deltas[j], piece_end + deltas[j]))
+            if piece_end < end:
+                j += 1
+            start = piece_end
+    return coalesce(mapped)
 
 
 def location_for_seed_ranges(seeds, almanac):
-    category = "seed"
-    ranges = seeds
-    while category != "location":
-        name, mapping = next(
-            (
-                (name, mapping)
-                for name, mapping in almanac.items()
-                if name.startswith(category)
-            ),
-            (None, None),
-        )
-        if name is None or mapping is None:
-            raise ValueError(f"Unknown category: {category}")
-        ranges = apply_mapping(ranges, mapping)
-        category = name.split("-")[-1]
-    return ranges
+    """Returns coalesced (start, end) location intervals for (start, length) seeds"""
+    intervals = coalesce((start, start + length) for start, length in seeds)
+    return apply_mapping(intervals, almanac)
 
 
 def find_lowest_seed_location_ranges(seeds, almanac):
     locations = location_for_seed_ranges(seeds, almanac)
-    return min(locations)[0]
+    return locations[0][0]
+
+
+# Cache
+
+cache_stats = Counter()
+# Bump when the on-disk layout changes so old cache files are never read
+CACHE_VERSION = 1
+
+
+def almanac_key(lines):
+    """Hash of the mapping lines, so seeds can change without missing the cache"""
+    digest = hashlib.sha256()
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("seeds:"):
+            digest.update(line.encode())
+            digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def save_almanac(path, almanac):
+    """Write a compiled almanac as int64s: piece count, breakpoints, deltas"""
+    breakpoints, deltas = almanac
+    data = array("q", [len(breakpoints)])
+    data.extend(breakpoints)
+    data.extend(deltas)
+    # Write then rename so concurrent runs never read a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        data.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def load_almanac(path):
+    """Read an almanac written by save_almanac, or None if the file is damaged"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    if len(raw) % array("q").itemsize:
+        return None
+    data = array("q")
+    data.frombytes(raw)
+    if not data or data[0] < 1 or len(data) != 2 * data[0] + 1:
+        return None
+    num_pieces = data[0]
+    return data[1 : num_pieces + 1].tolist(), data[num_pieces + 1 :].tolist()
+
+
+def cached_almanac(lines, cache_dir):
+    """Returns (seeds, almanac), reusing the compiled almanac in cache_dir if there"""
+    path = os.path.join(cache_dir, f"{almanac_key(lines)}.v{CACHE_VERSION}.almanac")
+    try:
+        almanac = load_almanac(path)
+    except FileNotFoundError:
+        almanac = None
+    if almanac is None:
+        cache_stats["misses"] += 1
+        seeds, mappings = parse_almanac(lines)
+        almanac = compile_almanac(mappings)
+        os.makedirs(cache_dir, exist_ok=True)
+        save_almanac(path, almanac)
+        return seeds, almanac
+    cache_stats["hits"] += 1
+    seeds = next(
+        (parse_seeds(line) for line in lines if line.startswith("seeds:")), []
+    )
+    return seeds, almanac
 
 
 def main():
@@ -131,17 +277,28 @@ def main():
         nargs="*",
         help="Files to read. If empty, stdin is used.",
     )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory to cache compiled almanacs in, keyed by a hash of the "
+        "mappings.",
+    )
     args = parser.parse_args()
     lines = list(fileinput.input(args.files))
     print(f"Num lines: {len(lines)}")
-    seeds, almanac = parse_almanac(lines)
+    if args.cache_dir:
+        seeds, almanac = cached_almanac(lines, args.cache_dir)
+        print(
+            f"Almanac cache hits: {cache_stats['hits']}, "
+            f"misses: {cache_stats['misses']}"
+        )
+    else:
+        seeds, mappings = parse_almanac(lines)
+        almanac = compile_almanac(mappings)
     # print("Seeds:", seeds)
-    # print("Almanac:", almanac)
     print("Lowest seed location:", find_lowest_seed_location(seeds, almanac))
-    seeds, almanac = parse_almanac(lines, use_seed_ranges=True)
     print(
         "Lowest seed location (with ranges):",
-        find_lowest_seed_location_ranges(seeds, almanac),
+        find_lowest_seed_location_ranges(seed_ranges(seeds), almanac),
     )
 
 
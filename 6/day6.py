@@ -1,6 +1,7 @@
 import argparse
 import fileinput
-from math import prod
+from itertools import starmap
+from math import isqrt, prod
 
 
 def parse_races(lines):
@@ -10,7 +11,7 @@ def parse_races(lines):
     return list(zip(times, distances, strict=True))
 
 
-def calc_num_winners(time, distance_record):
+def calc_num_winners_brute_force(time, distance_record):
     return sum(
         1
         for push_time in range(time + 1)
@@ -18,8 +19,34 @@ def calc_num_winners(time, distance_record):
     )
 
 
-def calc_winner_product(races):
-    return prod(calc_num_winners(*race) for race in races)
+def calc_num_winners(time, distance_record):
+    """Count push times that beat distance_record in O(1) with exact integer math
+
+    Winning push times lie strictly between the roots of
+    push_time * (time - push_time) = distance_record, which are symmetric around
+    time / 2.
+    """
+    discriminant = time * time - 4 * distance_record
+    best = time // 2
+    if discriminant <= 0 or best * (time - best) <= distance_record:
+        return 0
+    push_time = max((time - isqrt(discriminant)) // 2, 0)
+    # isqrt rounds down, so nudge onto the first winning push time
+    while push_time * (time - push_time) <= distance_record:
+        push_time += 1
+    while push_time and (push_time - 1) * (time - push_time + 1) > distance_record:
+        push_time -= 1
+    return time - 2 * push_time + 1
+
+
+def calc_winner_counts(races, brute_force=False):
+    """Returns number of ways to win for each (time, distance_record) in races"""
+    calc = calc_num_winners_brute_force if brute_force else calc_num_winners
+    return list(starmap(calc, races))
+
+
+def calc_winner_product(races, brute_force=False):
+    return prod(calc_winner_counts(races, brute_force=brute_force))
 
 
 def parse_single_race(lines):
@@ -37,15 +64,27 @@ def main():
         nargs="*",
         help="Files to read. If empty, stdin is used.",
     )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Check results against trying every push time.",
+    )
     args = parser.parse_args()
     lines = list(fileinput.input(args.files))
     print(f"Num lines: {len(lines)}")
     races = parse_races(lines)
-    print(f"Races: {races}")
-    print(f"Winner product: {calc_winner_product(races)}")
     single_race = parse_single_race(lines)
+    winner_counts = calc_winner_counts(races + [single_race])
+    if args.check:
+        expected = calc_winner_counts(races + [single_race], brute_force=True)
+        if winner_counts != expected:
+            raise ValueError(
+                f"Winner counts {winner_counts} don't match brute force {expected}"
+            )
+    print(f"Races: {races}")
+    print(f"Winner product: {prod(winner_counts[:-1])}")
     print(f"Race: {single_race}")
-    print(f"Number of ways to win single race: {calc_num_winners(*single_race)}")
+    print(f"Number of ways to win single race: {winner_counts[-1]}")
 
 
 if __name__ == "__main__":
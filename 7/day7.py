@@ -1,7 +1,12 @@
 import argparse
+from array import array
 import fileinput
 from collections import Counter
-from functools import cached_property, total_ordering
+from functools import cache
+import heapq
+from itertools import combinations_with_replacement, count, product
+from operator import mul
+import tempfile
 
 
 card_vals1 = {
@@ -20,76 +25,205 @@ card_vals2 = {
 }
 
 
-@total_ordering
-class Hand:
-    def __init__(self, cards, bid, wild=None):
-        self.cards = cards
-        self.bid = bid
-        self.wild = wild
+# Sorted card counts -> hand type, from five of a kind (7) down to high card (1)
+shapes_to_types = {
+    (5,): 7,
+    (4, 1): 6,
+    (3, 2): 5,
+    (3, 1, 1): 4,
+    (2, 2, 1): 3,
+    (2, 1, 1, 1): 2,
+    (1, 1, 1, 1, 1): 1,
+}
 
-    def __lt__(self, other):
-        return self.score_type < other.score_type or (
-            self.score_type == other.score_type and self.cards < other.cards
-        )
 
-    def __eq__(self, other):
-        return self.cards == other.cards
+# Packed keys hold the hand type above five 4-bit card values
+CARD_BITS = 4
+TYPE_SHIFT = 5 * CARD_BITS
 
-    def __hash__(self):
-        return hash(self.cards)
 
-    def __repr__(self):
-        return f"Hand({self.cards}, {self.bid})"
-
-    @cached_property
-    def score_type(self):
-        counts = Counter(self.cards)
-        if self.wild is not None:
-            num_types = len(counts.keys())
-            for card, _ in counts.most_common():
-                if card != self.wild:
-                    counts[card] += counts[self.wild]
-                    del counts[self.wild]
-                    break
-        num_types = len(counts.keys())
-        val = 0
-        if num_types == 1:
-            val = 7
-        elif num_types == 5:
-            val = 1
-        else:
-            highest = counts.most_common(1)[0][1]
-            if highest == 4:
-                val = 6
-            elif highest == 3:
-                if num_types == 2:
-                    val = 5
-                else:
-                    val = 4
-            elif highest == 2:
-                if num_types == 3:
-                    val = 3
-                else:
-                    val = 2
-        return val
-
-    def score(self, rank):
-        return rank * self.bid
+def hand_type(cards, wild=None):
+    counts = Counter(cards)
+    jokers = counts.pop(wild, 0) if wild is not None else 0
+    shape = sorted(counts.values(), reverse=True) or [0]
+    # Wild cards always do best joining the most common other card
+    shape[0] += jokers
+    return shapes_to_types[tuple(shape)]
+
+
+@cache
+def hand_type_table(wild_digit=None):
+    """Type of all 13 ** 5 hands, indexed by their cards as base 13 digits"""
+    types = {
+        cards: hand_type(cards, wild=wild_digit)
+        for cards in combinations_with_replacement(range(13), 5)
+    }
+    return bytes(
+        map(types.__getitem__, map(tuple, map(sorted, product(range(13), repeat=5))))
+    )
+
+
+def hand_key(hand, card_vals, wild=None):
+    """Hand string -> int that sorts hands by type and then by cards"""
+    low = min(card_vals.values())
+    table = hand_type_table(None if wild is None else wild - low)
+    packed = 0
+    index = 0
+    for card in hand:
+        val = card_vals[card]
+        packed = packed << CARD_BITS | val
+        index = index * 13 + val - low
+    return table[index] << TYPE_SHIFT | packed
+
+
+def hand_index(hand, card_vals, wild=None):
+    """Hand string -> dense index in [0, 7 * 13 ** 5) that sorts like hand_key"""
+    low = min(card_vals.values())
+    table = hand_type_table(None if wild is None else wild - low)
+    index = 0
+    for card in hand:
+        index = index * 13 + card_vals[card] - low
+    return (table[index] - 1) * 13**5 + index
 
 
 def parse_hands(lines, card_vals, wild=None):
-    """Returns list of (hand, bid)"""
-    hands = []
+    """Returns (keys, bids) arrays with one packed hand key and bid per line"""
+    keys = array("L")
+    bids = array("Q")
     for line in lines:
         hand, bid = line.strip().split()
-        hand = tuple(card_vals[card] for card in hand)
-        bid = int(bid)
-        hands.append(Hand(hand, bid, wild=wild))
-    return hands
+        keys.append(hand_key(hand, card_vals, wild=wild))
+        bids.append(int(bid))
+    return keys, bids
 
 
 def score_hands(hands):
-    return sum(hand.score(i) for i, hand in enumerate(sorted(hands), start=1))
+    keys, bids = hands
+    # Stable sort, so identical hands keep their input order like before
+    ranked = sorted(range(len(keys)), key=keys.__getitem__)
+    return sum(map(mul, count(1), map(bids.__getitem__, ranked)))
+
+
+# Incremental index
+
+
+class FenwickTree:
+    """Sparse Fenwick tree over indices in [0, size) for O(log size) prefix sums"""
+
+    def __init__(self, size):
+        self.size = size
+        self.tree = {}
+
+    def add(self, index, value):
+        index += 1
+        while index <= self.size:
+            self.tree[index] = self.tree.get(index, 0) + value
+            index += index & -index
+
+    def prefix_sum(self, index):
+        """Sum of values at indices < index"""
+        total = 0
+        while index > 0:
+            total += self.tree.get(index, 0)
+            index -= index & -index
+        return total
+
+
+class RankedHands:
+    """Hands ranked as they are inserted, with total winnings kept up to date
+
+    Counts and bids are kept in Fenwick trees over the hand_index key space, so
+    inserts and rank queries are O(log n) in the size of that space.
+    """
+
+    def __init__(self, card_vals, wild=None):
+        self.card_vals = card_vals
+        self.wild = wild
+        self.counts = FenwickTree(7 * 13**5)
+        self.bids = FenwickTree(7 * 13**5)
+        self.num_hands = 0
+        self.total_bids = 0
+        self.winnings = 0
+
+    def __len__(self):
+        return self.num_hands
+
+    def __repr__(self):
+        return f"RankedHands({self.num_hands} hands, winnings={self.winnings})"
+
+    def insert(self, hand, bid):
+        """Add hand with bid and return its rank"""
+        index = hand_index(hand, self.card_vals, wild=self.wild)
+        # Ties are ranked in insertion order, so this goes after identical hands
+        rank = self.counts.prefix_sum(index + 1) + 1
+        # Every hand ranked above the new one moves up a rank
+        bids_above = self.total_bids - self.bids.prefix_sum(index + 1)
+        self.winnings += rank * bid + bids_above
+        self.counts.add(index, 1)
+        self.bids.add(index, bid)
+        self.num_hands += 1
+        self.total_bids += bid
+        return rank
+
+    def rank(self, hand):
+        """Rank of the first hand identical to hand, or the rank it would get"""
+        index = hand_index(hand, self.card_vals, wild=self.wild)
+        return self.counts.prefix_sum(index) + 1
+
+
+# External merge sort
+
+# Index of the hand in the input, kept in the sort key so ties stay stable
+INDEX_BITS = 40
+
+
+def write_run(records, tmp_dir=None):
+    """Sort (sort_key, bid) records and spill them to a temp file"""
+    records.sort()
+    data = array("Q")
+    for sort_key, bid in records:
+        data.append(sort_key)
+        data.append(bid)
+    run = tempfile.TemporaryFile(dir=tmp_dir)
+    data.tofile(run)
+    run.seek(0)
+    return run
+
+
+def read_run(run, block_size=65_536):
+    """Yield (sort_key, bid) records from a run, block_size records at a time"""
+    while chunk := run.read(block_size * 2 * 8):
+        data = array("Q")
+        data.frombytes(chunk)
+        yield from zip(data[::2], data[1::2])
+
+
+def score_hands_external(
+    lines, card_vals, wild=None, run_size=1_000_000, tmp_dir=None
+):
+    """Like score_hands, but only holds run_size hands in memory at a time
+
+    Hands are encoded as fixed-width (sort_key, bid) records, sorted in runs of
+    run_size that are spilled to temp files in tmp_dir, and then the runs are
+    merged to assign ranks.
+    """
+    runs = []
+    try:
+        records = []
+        for index, line in enumerate(lines):
+            hand, bid = line.split()
+            sort_key = hand_key(hand, card_vals, wild=wild) << INDEX_BITS | index
+            records.append((sort_key, int(bid)))
+            if len(records) >= run_size:
+                runs.append(write_run(records, tmp_dir))
+                records = []
+        if records:
+            runs.append(write_run(records, tmp_dir))
+        merged = heapq.merge(*(read_run(run) for run in runs))
+        return sum(rank * bid for rank, (_, bid) in enumerate(merged, start=1))
+    finally:
+        for run in runs:
+            run.close()
 
 
 def main():
@@ -100,9 +234,55 @@ def main():
         nargs="*",
         help="Files to read. If empty, stdin is used.",
     )
+    parser.add_argument(
+        "--external",
+        action="store_true",
+        help="Sort hands in runs spilled to temp files instead of all in memory.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Insert hands one at a time into a ranked index.",
+    )
+    parser.add_argument(
+        "--run-size",
+        type=int,
+        default=1_000_000,
+        help="Number of hands to sort in memory at a time with --external.",
+    )
+    parser.add_argument(
+        "--tmp-dir",
+        help="Directory for --external runs. Defaults to the system temp dir.",
+    )
     args = parser.parse_args()
+    if args.external:
+        if not args.files:
+            parser.error("--external requires FILEs, stdin can only be read once")
+        for part, card_vals, wild in (
+            (1, card_vals1, None),
+            (2, card_vals2, card_vals2["J"]),
+        ):
+            score = score_hands_external(
+                fileinput.input(args.files),
+                card_vals,
+                wild=wild,
+                run_size=args.run_size,
+                tmp_dir=args.tmp_dir,
+            )
+            print(f"Score {part}: {score}")
+        return
     lines = list(fileinput.input(args.files))
     print(f"Num lines: {len(lines)}")
+    if args.incremental:
+        ranked1 = RankedHands(card_vals1)
+        ranked2 = RankedHands(card_vals2, wild=card_vals2["J"])
+        for line in lines:
+            hand, bid = line.split()
+            ranked1.insert(hand, int(bid))
+            ranked2.insert(hand, int(bid))
+        print(f"Score 1: {ranked1.winnings}")
+        print(f"Score 2: {ranked2.winnings}")
+        return
     hands = parse_hands(lines, card_vals1)
     # print(f"Hands: {hands}")
     print(f"Score 1: {score_hands(hands)}")
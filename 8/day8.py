@@ -1,7 +1,10 @@
 import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 import fileinput
 import itertools
 import math
+from operator import or_
 
 
 direction_indices = {"L": 0, "R": 1}
@@ -18,29 +21,198 @@ def parse_directions_and_network(lines):
     return directions, network
 
 
+def compile_network(directions, network):
+    """Returns (names, successors, moves) with nodes as indices into names
+
+    successors is a pair of arrays holding the left and right child of each node
+    and moves is the directions encoded as indices into successors.
+    """
+    names = list(network)
+    indices = {name: i for i, name in enumerate(names)}
+    successors = tuple(
+        array("L", (indices[network[name][side]] for name in names))
+        for side in direction_indices.values()
+    )
+    moves = bytes(direction_indices[direction] for direction in directions)
+    return names, successors, moves
+
+
+class JumpTable:
+    """Binary lifting over whole passes through the directions
+
+    jumps[k][node] is the node reached after 2 ** k passes starting at node, and
+    hits[k][node] says whether any of those steps lands on a target node.
+    hit_steps[node] lists every step in a single pass from node that lands on a
+    target.
+    """
+
+    def __init__(self, successors, moves, targets):
+        self.successors = successors
+        self.moves = moves
+        # Walk every node through one pass at once, noting the target hits
+        nodes = range(len(targets))
+        current = list(nodes)
+        hit_steps = [[] for _ in nodes]
+        for step, move in enumerate(moves, start=1):
+            current = list(map(successors[move].__getitem__, current))
+            for node in itertools.compress(nodes, map(targets.__getitem__, current)):
+                hit_steps[node].append(step)
+        self.hit_steps = hit_steps
+        self.first_hits = array("l", (steps[0] if steps else -1 for steps in hit_steps))
+        self.jumps = [array("L", current)]
+        self.hits = [bytes(bool(steps) for steps in hit_steps)]
+        # Enough levels to cover as many passes as there are nodes, after which
+        # the walk must be repeating
+        self.extend(len(targets).bit_length() + 1)
+
+    def extend(self, levels):
+        """Add lifting levels until there are at least levels of them"""
+        while len(self.jumps) < levels:
+            jump = self.jumps[-1]
+            hit = self.hits[-1]
+            self.jumps.append(array("L", map(jump.__getitem__, jump)))
+            self.hits.append(bytes(map(or_, hit, map(hit.__getitem__, jump))))
+
+    def steps_to_target(self, start):
+        """Number of steps from start until a target node is first reached"""
+        if not self.hits[-1][start]:
+            raise ValueError(f"No target is reachable from node {start}")
+        node = start
+        passes = 0
+        for level in reversed(range(len(self.jumps))):
+            if not self.hits[level][node]:
+                node = self.jumps[level][node]
+                passes += 1 << level
+        return passes * len(self.moves) + self.first_hits[node]
+
+    def position_after(self, start, num_steps):
+        """Node reached after num_steps steps from start"""
+        passes, rest = divmod(num_steps, len(self.moves))
+        self.extend(passes.bit_length())
+        node = start
+        for level, jump in enumerate(self.jumps):
+            if passes >> level & 1:
+                node = jump[node]
+        for move in self.moves[:rest]:
+            node = self.successors[move][node]
+        return node
+
+
 def traverse_network(directions, network, start="AAA", end="ZZZ"):
-    """Returns the path traversed"""
-    path = [start]
-    while path[-1] != end:
-        for direction in directions:
-            path.append(network[path[-1]][direction_indices[direction]])
-    return path
-
-
-def multi_traverse_network(directions, network):
-    """Returns the path length of a multi-traversal of the network"""
-    curr_nodes = tuple(node for node in network if node.endswith("A"))
-    path_lengths = []
-    for node in curr_nodes:
-        path_length = 0
-        for direction in itertools.cycle(directions):
-            dir_idx = direction_indices[direction]
-            node = network[node][dir_idx]
-            path_length += 1
-            if node.endswith("Z"):
-                path_lengths.append(path_length)
-                break
-    return math.lcm(*path_lengths)
+    """Returns the number of steps from start to end"""
+    names, successors, moves = compile_network(directions, network)
+    targets = bytes(name == end for name in names)
+    return JumpTable(successors, moves, targets).steps_to_target(names.index(start))
+
+
+def analyze_ghost(start, jump, hit_steps, pass_length):
+    """Returns (tail, tail_hits, cycle, cycle_hits) for a ghost starting at start
+
+    Everything is in steps. The ghost is on a target at step t < tail iff t is in
+    tail_hits, and at step t >= tail iff (t - tail) % cycle is in cycle_hits. The
+    walk is tracked at pass boundaries, where the (node, direction index) state
+    always has direction index 0, so a repeated node means a repeated state.
+    """
+    seen = {}
+    passes = []
+    node = start
+    while node not in seen:
+        seen[node] = len(passes)
+        passes.append(node)
+        node = jump[node]
+    tail = seen[node] * pass_length
+    cycle = len(passes) * pass_length - tail
+    hits = [
+        i * pass_length + step
+        for i, node in enumerate(passes)
+        for step in hit_steps[node]
+    ]
+    tail_hits = {hit for hit in hits if hit < tail}
+    cycle_hits = {(hit - tail) % cycle for hit in hits if hit >= tail}
+    return tail, tail_hits, cycle, cycle_hits
+
+
+def analyze_ghosts(starts, jump, hit_steps, pass_length):
+    return [analyze_ghost(start, jump, hit_steps, pass_length) for start in starts]
+
+
+def at_target(ghost, t):
+    tail, tail_hits, cycle, cycle_hits = ghost
+    return t in tail_hits if t < tail else (t - tail) % cycle in cycle_hits
+
+
+def crt(a, m, b, n):
+    """Solve x = a mod m and x = b mod n -> (x, lcm(m, n)), or None if impossible"""
+    gcd = math.gcd(m, n)
+    if (b - a) % gcd:
+        return None
+    lcm = m // gcd * n
+    k = (b - a) // gcd * pow(m // gcd, -1, n // gcd) % (n // gcd)
+    return (a + m * k) % lcm, lcm
+
+
+def solve_arrival(ghosts):
+    """Smallest step t >= 1 where every ghost is on a target, or None if never
+
+    With no ghosts there is nothing to wait for, so this is 0.
+    """
+    if not ghosts:
+        return 0
+    max_tail = max(tail for tail, _, _, _ in ghosts)
+    # Before every ghost is cycling, try each step the first ghost hits a target
+    tail, tail_hits, cycle, cycle_hits = ghosts[0]
+    candidates = set(tail_hits)
+    for cycle_start in range(tail, max_tail, cycle):
+        candidates.update(cycle_start + hit for hit in cycle_hits)
+    for t in sorted(candidates):
+        if 1 <= t < max_tail and all(at_target(ghost, t) for ghost in ghosts):
+            return t
+    # After that each ghost hits targets at fixed residues, so combine them
+    residues = {0}
+    modulus = 1
+    for tail, _, cycle, cycle_hits in ghosts:
+        combined = set()
+        for residue in residues:
+            for hit in cycle_hits:
+                solution = crt(residue, modulus, (tail + hit) % cycle, cycle)
+                if solution is not None:
+                    combined.add(solution[0])
+        if not combined:
+            return None
+        residues = combined
+        modulus = math.lcm(modulus, cycle)
+    lowest = max(max_tail, 1)
+    return min(
+        residue + max(0, -(-(lowest - residue) // modulus)) * modulus
+        for residue in residues
+    )
+
+
+def multi_traverse_network(directions, network, processes=None):
+    """Returns the first step where every ghost is on a node ending in Z
+
+    Ghosts start on every node ending in A and are analyzed in a process pool if
+    processes is given. If no node ends in A, no steps are taken and this is 0.
+    """
+    names, successors, moves = compile_network(directions, network)
+    table = JumpTable(successors, moves, bytes(name.endswith("Z") for name in names))
+    starts = [i for i, name in enumerate(names) if name.endswith("A")]
+    if not starts:
+        return 0
+    tables = (table.jumps[0], table.hit_steps, len(moves))
+    if processes:
+        chunks = [starts[i::processes] for i in range(processes)]
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            ghosts = list(
+                itertools.chain.from_iterable(
+                    executor.map(
+                        analyze_ghosts, chunks, *(itertools.repeat(t) for t in tables)
+                    )
+                )
+            )
+    else:
+        ghosts = analyze_ghosts(starts, *tables)
+    return solve_arrival(ghosts)
 
 
 def main():
@@ -51,15 +223,23 @@ def main():
         nargs="*",
         help="Files to read. If empty, stdin is used.",
     )
+    parser.add_argument(
+        "--processes",
+        "-p",
+        type=int,
+        help="Analyze ghosts in this many worker processes.",
+    )
     args = parser.parse_args()
     lines = list(fileinput.input(args.files))
     print(f"Num lines: {len(lines)}")
     directions, network = parse_directions_and_network(lines)
     if "AAA" in network:
-        path = traverse_network(directions, network)
-        # print(f"Path: {path}")
-        print(f"Num steps (not including start): {len(path) - 1}")
-    print(f"Multi-traversal length: {multi_traverse_network(directions, network)}")
+        num_steps = traverse_network(directions, network)
+        print(f"Num steps (not including start): {num_steps}")
+    multi_length = multi_traverse_network(
+        directions, network, processes=args.processes
+    )
+    print(f"Multi-traversal length: {multi_length}")
 
 
 if __name__ == "__main__":
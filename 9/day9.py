@@ -1,5 +1,8 @@
 import argparse
 import fileinput
+from functools import cache
+from math import comb
+from operator import add, mul
 
 
 def get_difference_stack(line):
@@ -13,47 +16,149 @@ def get_difference_stack(line):
     return num_stack
 
 
-def predict_next(line, verbose=False):
-    num_stack = get_difference_stack(line)
-    if verbose:
-        print_stack(num_stack)
+@cache
+def extrapolation_weights(length):
+    """Returns (next_weights, prev_weights) for sequences of length numbers
 
-    # predict the next numbers
-    for i, numbers in enumerate(reversed(num_stack)):
-        if i == 0:
-            prev_num = 0
-        else:
-            prev_num = num_stack[-i][-1]
-        numbers.append(prev_num + numbers[-1])
+    Extending the difference stack by one on either side works out to a dot
+    product of the numbers with alternating-sign binomial coefficients.
+    """
+    next_weights = tuple(
+        (-1) ** (length - 1 - i) * comb(length, i) for i in range(length)
+    )
+    prev_weights = tuple((-1) ** i * comb(length, i + 1) for i in range(length))
+    return next_weights, prev_weights
 
-    if verbose:
-        print_stack(num_stack)
-        print("-" * 40)
-        print()
 
-    return num_stack[0][-1]
+def parse_numbers(line):
+    return [int(x) for x in line.split()]
 
 
-def predict_prev(line, verbose=False):
+def print_extended_stack(line, prediction, at_end):
+    """Print the difference stack for line before and after adding prediction
+
+    Each level gets the number that keeps the level below it consistent, so the
+    top level ends up with prediction at its end if at_end, else at its start.
+    """
     num_stack = get_difference_stack(line)
+    print_stack(num_stack)
+    added = 0
+    for numbers in reversed(num_stack):
+        if at_end:
+            added += numbers[-1]
+            numbers.append(added)
+        else:
+            added = numbers[0] - added
+            numbers.insert(0, added)
+    if added != prediction:
+        raise ValueError(f"Difference stack predicts {added}, not {prediction}")
+    print_stack(num_stack)
+    print("-" * 40)
+    print()
 
+
+def predict_next(line, verbose=False):
+    numbers = parse_numbers(line)
+    next_weights, _ = extrapolation_weights(len(numbers))
+    prediction = sum(map(mul, next_weights, numbers))
     if verbose:
-        print_stack(num_stack)
+        print_extended_stack(line, prediction, at_end=True)
+    return prediction
 
-    # predict the next numbers
-    for i, numbers in enumerate(reversed(num_stack)):
-        if i == 0:
-            prev_num = 0
-        else:
-            prev_num = num_stack[-i][0]
-        numbers.insert(0, numbers[0] - prev_num)
 
+def predict_prev(line, verbose=False):
+    numbers = parse_numbers(line)
+    _, prev_weights = extrapolation_weights(len(numbers))
+    prediction = sum(map(mul, prev_weights, numbers))
     if verbose:
-        print_stack(num_stack)
-        print("-" * 40)
-        print()
-
-    return num_stack[0][0]
+        print_extended_stack(line, prediction, at_end=False)
+    return prediction
+
+
+def predict_sums(lines):
+    """Returns (sum of next predictions, sum of previous predictions) for lines
+
+    Predictions are linear in the numbers, so lines of the same length are summed
+    column-wise first and the weights are applied once per length.
+    """
+    column_sums = {}
+    for line in lines:
+        numbers = parse_numbers(line)
+        columns = column_sums.get(len(numbers))
+        column_sums[len(numbers)] = (
+            numbers if columns is None else list(map(add, columns, numbers))
+        )
+    next_sum = 0
+    prev_sum = 0
+    for length, columns in column_sums.items():
+        next_weights, prev_weights = extrapolation_weights(length)
+        next_sum += sum(map(mul, next_weights, columns))
+        prev_sum += sum(map(mul, prev_weights, columns))
+    return next_sum, prev_sum
+
+
+class StreamingPredictor:
+    """Predict upcoming readings of a series as readings are appended
+
+    Only the last value at each level of the difference stack is kept, so an
+    append is O(levels). Levels above the last nonzero one are only counted, so
+    a series that stays a polynomial of degree d keeps d + 1 levels however long
+    it gets, and forecasts match the full difference stack exactly. max_degree
+    caps the number of difference levels, which is exact for series that are
+    polynomials of at most that degree.
+    """
+
+    def __init__(self, max_degree=None):
+        self.max_degree = max_degree
+        self.tails = []
+        # Number of all-zero levels above the last one in tails
+        self.zero_levels = 0
+
+    def __repr__(self):
+        return (
+            f"StreamingPredictor(tails={self.tails}, zero_levels={self.zero_levels})"
+        )
+
+    def append(self, value):
+        diff = value
+        for level, tail in enumerate(self.tails):
+            self.tails[level] = diff
+            diff -= tail
+        # Subtracting zero tails leaves diff as is, so every zero level becomes diff
+        new_levels = self.zero_levels
+        if self.max_degree is None or len(self.tails) + new_levels <= self.max_degree:
+            new_levels += 1
+        if diff:
+            self.tails.extend([diff] * new_levels)
+            self.zero_levels = 0
+        else:
+            self.zero_levels = new_levels
+        while self.tails and not self.tails[-1]:
+            self.tails.pop()
+            self.zero_levels += 1
+
+    def forecast(self, steps=1):
+        """Predict the reading steps after the last one"""
+        if steps < 1:
+            raise ValueError(f"steps must be at least 1, not {steps}")
+        return sum(
+            comb(steps + level - 1, level) * tail
+            for level, tail in enumerate(self.tails)
+        )
+
+
+def stream_predictions(readings, max_degree=None):
+    """Consume (series_id, value) readings and yield (series_id, next prediction)
+
+    Readings for different series can be interleaved in any order.
+    """
+    predictors = {}
+    for series_id, value in readings:
+        predictor = predictors.get(series_id)
+        if predictor is None:
+            predictor = predictors[series_id] = StreamingPredictor(max_degree)
+        predictor.append(value)
+        yield series_id, predictor.forecast()
 
 
 def print_stack(num_stack):
@@ -74,13 +179,29 @@ def main():
         nargs="*",
         help="Files to read. If empty, stdin is used.",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Feed the lines through streaming predictors, one series per line, "
+        "with readings interleaved across series.",
+    )
     args = parser.parse_args()
     lines = list(fileinput.input(args.files))
     print(f"Num lines: {len(lines)}")
-    predictions = [predict_next(line) for line in lines]
-    print(f"Prediction sum (-1): {sum(predictions)}")
-    predictions = [predict_prev(line) for line in lines]
-    print(f"Prediction sum (0): {sum(predictions)}")
+    if args.stream:
+        series = [parse_numbers(line) for line in lines]
+        readings = (
+            (series_id, numbers[i])
+            for i in range(max(map(len, series)))
+            for series_id, numbers in enumerate(series)
+            if i < len(numbers)
+        )
+        latest = dict(stream_predictions(readings))
+        print(f"Prediction sum (-1): {sum(latest.values())}")
+        return
+    next_sum, prev_sum = predict_sums(lines)
+    print(f"Prediction sum (-1): {next_sum}")
+    print(f"Prediction sum (0): {prev_sum}")
 
 
 if __name__ == "__main__":